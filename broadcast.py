@@ -0,0 +1,265 @@
+# broadcast.py — Persistent user registry and rate-limited, resumable broadcasts
+
+import os
+import json
+import time
+import asyncio
+import logging
+from telethon.errors.rpcerrorlist import (
+    FloodWaitError, UserIsBlockedError, InputUserDeactivatedError,
+    PeerIdInvalidError, UserDeactivatedError
+)
+from config import SESSIONS_DIR, BROADCAST_RATE, USERS_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Paths for the user registry and the broadcast checkpoint
+USERS_FILE      = os.path.join(SESSIONS_DIR, "users.json")
+BROADCAST_FILE  = os.path.join(SESSIONS_DIR, "broadcast.json")             # offset & counters
+RECIPIENTS_FILE = os.path.join(SESSIONS_DIR, "broadcast_recipients.json")  # written once per run
+
+CHECKPOINT_EVERY = 50   # sends between checkpoint writes
+REPORT_EVERY     = 5    # seconds between live status edits
+
+# errors that mean the user is gone for good
+_DEAD_USER_ERRORS = (
+    UserIsBlockedError, InputUserDeactivatedError,
+    UserDeactivatedError, PeerIdInvalidError
+)
+
+# In‑memory state
+known_users  = set()    # every uid that has talked to the bot
+_users_dirty = False
+current      = None     # the running Broadcast, if any
+
+# ─── USER REGISTRY ───────────────────────────────────────────────────
+
+def _load_users():
+    try:
+        with open(USERS_FILE, 'r') as f:
+            known_users.update(int(u) for u in json.load(f))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"⚠️ Could not load {USERS_FILE}: {e}")
+
+def _save_users():
+    global _users_dirty
+    try:
+        os.makedirs(os.path.dirname(USERS_FILE), exist_ok=True)
+        tmp = USERS_FILE + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(sorted(known_users), f)
+        os.replace(tmp, USERS_FILE)
+        _users_dirty = False
+    except Exception as e:
+        logger.error(f"⚠️ Could not save {USERS_FILE}: {e}")
+
+# Load on import
+_load_users()
+
+def register_user(uid: int):
+    """Remember `uid`; written to disk by flush_users_loop()."""
+    global _users_dirty
+    if uid and uid not in known_users:
+        known_users.add(uid)
+        _users_dirty = True
+
+def forget_user(uid: int):
+    global _users_dirty
+    if uid in known_users:
+        known_users.discard(uid)
+        _users_dirty = True
+
+async def flush_users_loop():
+    """Write the registry to disk in batches instead of on every new user."""
+    while True:
+        await asyncio.sleep(USERS_FLUSH_INTERVAL)
+        if _users_dirty:
+            _save_users()
+
+def _write_json(path, data):
+    try:
+        with open(path + ".tmp", 'w') as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+    except Exception as e:
+        logger.error(f"⚠️ Could not save {path}: {e}")
+
+# ─── RATE LIMITING ───────────────────────────────────────────────────
+
+class TokenBucket:
+    """
+    Token bucket for the broadcast lane. Interactive traffic calls
+    yield_to() which puts the bucket into debt, so broadcasts slow down
+    whenever real users are active.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate     = rate
+        self.capacity = capacity or rate
+        self.tokens   = self.capacity
+        self.stamp    = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp  = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def yield_to(self, n: float = 1):
+        self._refill()
+        self.tokens = max(-self.capacity, self.tokens - n)
+
+broadcast_bucket = TokenBucket(BROADCAST_RATE)
+
+def note_interactive():
+    """Called for every interactive update so broadcasts give way to it."""
+    broadcast_bucket.yield_to()
+
+# ─── BROADCAST ENGINE ────────────────────────────────────────────────
+
+class Broadcast:
+    def __init__(self, text=None, src=None, recipients=None, offset=0,
+                 sent=0, failed=0, pruned=0, status_msg=None):
+        self.text       = text          # plain text to send, or
+        self.src        = src           # [chat_id, msg_id] of a message to copy
+        self.recipients = recipients or []
+        self.offset     = offset        # index of the next recipient
+        self.sent       = sent
+        self.failed     = failed
+        self.pruned     = pruned
+        self.status_msg = status_msg    # [chat_id, msg_id] of the live report
+        self.stopped    = False
+        self.paused     = False         # stopped for a restart; keep the checkpoint
+        self.started    = time.monotonic()
+        self.base       = offset        # offset at (re)start, for throughput
+        self.task       = None
+
+    def to_dict(self):
+        return {
+            'text': self.text, 'src': self.src,
+            'offset': self.offset, 'sent': self.sent, 'failed': self.failed,
+            'pruned': self.pruned, 'status_msg': self.status_msg
+        }
+
+    def save_recipients(self):
+        """Write the recipient snapshot; done once, checkpoints only track the offset."""
+        _write_json(RECIPIENTS_FILE, self.recipients)
+
+    def checkpoint(self):
+        _write_json(BROADCAST_FILE, self.to_dict())
+
+    def report(self) -> str:
+        total   = len(self.recipients)
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        rate    = (self.offset - self.base) / elapsed
+        eta     = int((total - self.offset) / rate) if rate else 0
+        state   = "⏸️ Paused for restart" if self.paused else "🛑 Stopped" if self.stopped else "✅ Done" if self.offset >= total else "📣 Broadcasting…"
+        return (
+            f"{state}\n"
+            f"Progress: {self.offset}/{total}\n"
+            f"Delivered: {self.sent} • Failed: {self.failed} • Pruned: {self.pruned}\n"
+            f"Throughput: {rate:.1f} msg/s • ETA: {eta}s"
+        )
+
+    async def pause(self):
+        """Stop for a restart, leaving the checkpoint for resume_broadcast()."""
+        self.paused = self.stopped = True
+        if self.task:
+            self.task.cancel()
+            try: await self.task
+            except asyncio.CancelledError: pass
+
+    async def _send(self, bot, uid, message):
+        while True:
+            await broadcast_bucket.acquire()
+            try:
+                await bot.send_message(uid, message if message is not None else self.text)
+                return True
+            except FloodWaitError as e:
+                logger.warning(f"⚠️ Broadcast FloodWait {e.seconds}s")
+                await asyncio.sleep(e.seconds + 1)
+            except _DEAD_USER_ERRORS:
+                forget_user(uid)
+                self.pruned += 1
+                return False
+            except Exception as e:
+                logger.warning(f"⚠️ Broadcast to {uid} failed: {e}")
+                self.failed += 1
+                return False
+
+    async def _update_status(self, bot):
+        if not self.status_msg:
+            return
+        try: await bot.edit_message(self.status_msg[0], self.status_msg[1], self.report())
+        except: pass
+
+    async def run(self, bot):
+        global current
+        message = None
+        last_report = 0
+        try:
+            if self.src:
+                message = await bot.get_messages(self.src[0], ids=self.src[1])
+                if message is None:
+                    logger.error("❌ Broadcast source message is gone, aborting")
+                    self.stopped = True
+
+            while not self.stopped and self.offset < len(self.recipients):
+                uid = self.recipients[self.offset]
+                if await self._send(bot, uid, message):
+                    self.sent += 1
+                self.offset += 1
+
+                if self.offset % CHECKPOINT_EVERY == 0:
+                    self.checkpoint()
+                if time.monotonic() - last_report >= REPORT_EVERY:
+                    last_report = time.monotonic()
+                    await self._update_status(bot)
+        finally:
+            await self._update_status(bot)
+            if (self.stopped and not self.paused) or self.offset >= len(self.recipients):
+                for path in (BROADCAST_FILE, RECIPIENTS_FILE):
+                    try: os.remove(path)
+                    except FileNotFoundError: pass
+            else:
+                self.checkpoint()
+            if current is self:
+                current = None
+            if _users_dirty:
+                _save_users()
+
+def start_broadcast(bot, text=None, src=None, status_msg=None) -> Broadcast:
+    """Snapshot the registry and start sending in the background."""
+    global current
+    current = Broadcast(text=text, src=src, recipients=sorted(known_users), status_msg=status_msg)
+    current.save_recipients()
+    current.checkpoint()
+    current.task = asyncio.create_task(current.run(bot))
+    return current
+
+def resume_broadcast(bot):
+    """Continue a broadcast interrupted by a restart, if there is one."""
+    global current
+    try:
+        with open(BROADCAST_FILE, 'r') as f:
+            data = json.load(f)
+        with open(RECIPIENTS_FILE, 'r') as f:
+            recipients = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"⚠️ Could not load {BROADCAST_FILE}: {e}")
+        return None
+    current = Broadcast(recipients=recipients, **data)
+    current.task = asyncio.create_task(current.run(bot))
+    logger.info(f"📣 Resuming broadcast at {current.offset}/{len(current.recipients)}")
+    return current
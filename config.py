@@ -13,5 +13,13 @@ ADMIN_USERNAME = "admiinnn69"
 WORKER_COUNT         = 4
 UPLOAD_DELAY         = 2      # seconds between uploads (tuned)
 SUB_CLEANUP_INTERVAL = 3600   # seconds between subscription‐cleanup runs
+USER_INBOX_LIMIT     = 8      # pending messages per user before new ones are dropped
+BROADCAST_RATE       = 20     # broadcast messages per second (shared with interactive traffic)
+USERS_FLUSH_INTERVAL = 30     # seconds between user-registry writes
+DRAIN_TIMEOUT        = 60     # seconds in-flight transfers get to finish on shutdown
+SESSION_DB_POOL      = 4      # pooled connections to the shared session database
+SESSION_FLUSH_EVERY  = 5      # seconds between batched session writes
+USERNAME_TTL         = 86400  # seconds a resolved public username stays cached
+USERNAME_MISS_TTL    = 600    # seconds a missing username stays cached
 
 BOT_USERNAME    = "@restricted1_saverbot"  # without the '@'
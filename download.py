@@ -1,11 +1,22 @@
 import logging, asyncio, os
 from telethon.errors.rpcerrorlist import FloodWaitError
 from tele_utils import get_user_client, load_all_dialogs, user_dialogs_cache
+from jobs import JobCancelled, in_flight, item_started, item_done
+from username_cache import resolve_username
 from config import DOWNLOAD_DIR
 
 logger = logging.getLogger(__name__)
 task_queue = None
 send_queue = None
+deferred   = {}     # TimerHandle -> queue item waiting out a username FloodWait
+
+def _defer(item, delay):
+    """Put `item` back on task_queue after `delay` seconds."""
+    def requeue():
+        deferred.pop(handle, None)
+        task_queue.put_nowait(item)
+    handle = asyncio.get_running_loop().call_later(delay, requeue)
+    deferred[handle] = item
 
 async def download_worker():
     # allow 8× concurrent tasks per CPU
@@ -16,28 +27,61 @@ async def download_worker():
         if send_queue.qsize() > 50:
             await asyncio.sleep(0.5)
 
-        uid, cid, mid, priv = await task_queue.get()
+        uid, cid, mid, priv, batch = await task_queue.get()
+        job = (uid, cid, mid, priv)
+        if batch.cancelled:
+            item_done(batch)
+            task_queue.task_done()
+            continue
+        item_started(job)
+
         async with sem:
             logger.info(f"🛠 [Download] uid={uid} cid={cid} mid={mid} priv={priv}")
             client = await get_user_client(uid)
             if priv and uid not in user_dialogs_cache:
                 await load_all_dialogs(client, uid)
-            entity = user_dialogs_cache.get(uid, {}).get(cid) if priv else cid
+            if priv:
+                entity = user_dialogs_cache.get(uid, {}).get(cid)
+            else:
+                try:
+                    entity = await batch.run(resolve_username(client, uid, cid))
+                except JobCancelled:
+                    item_done(batch, job)
+                    task_queue.task_done()
+                    continue
+                except FloodWaitError as e:
+                    # the account can't resolve usernames for a while: retry
+                    # the job later instead of parking this worker on it
+                    logger.warning(f"⏳ Deferring uid={uid} cid={cid} mid={mid} by {e.seconds}s")
+                    in_flight.discard(job)
+                    _defer((uid, cid, mid, priv, batch), e.seconds)
+                    task_queue.task_done()
+                    continue
+                except Exception:
+                    entity = None
             if not entity:
                 logger.warning("⚠️ Chat not found")
+                item_done(batch, job)
                 task_queue.task_done()
                 continue
 
             try:
-                msg = await client.get_messages(entity, ids=mid)
+                msg = await batch.run(client.get_messages(entity, ids=mid))
+            except JobCancelled:
+                item_done(batch, job)
+                task_queue.task_done()
+                continue
             except FloodWaitError as e:
                 logger.warning(f"⚠️ FloodWait {e.seconds}s")
-                await asyncio.sleep(e.seconds + 1)
+                try: await batch.run(asyncio.sleep(e.seconds + 1))
+                except JobCancelled: pass
+                item_done(batch, job)
                 task_queue.task_done()
                 continue
 
             if not msg or not msg.media:
                 logger.warning("⚠️ No media")
+                item_done(batch, job)
                 task_queue.task_done()
                 continue
 
@@ -48,17 +92,28 @@ async def download_worker():
             # ── download directly to disk ─────────────────────
             os.makedirs(DOWNLOAD_DIR, exist_ok=True)
             ext = ".mp4" if msg.video else ".jpg" if msg.photo else ""
-            path = os.path.join(DOWNLOAD_DIR, f"{mid}{ext}")
+            # unique per user/batch/chat so cleaning up one job never hits another's file
+            path = os.path.join(DOWNLOAD_DIR, f"{uid}_{batch.id}_{cid}_{mid}{ext}")
             try:
-                await client.download_media(msg, path)
+                await batch.run(client.download_media(msg, path))
             except Exception as e:
-                logger.error(f"❌ File download failed: {e}")
+                if isinstance(e, JobCancelled):
+                    logger.info(f"🛑 Download cancelled uid={uid} mid={mid}")
+                else:
+                    logger.error(f"❌ File download failed: {e}")
+                # drop the partial file right away
+                if os.path.exists(path):
+                    try: os.remove(path)
+                    except: pass
+                item_done(batch, job)
                 task_queue.task_done()
                 continue
 
             # enqueue for upload by filepath
             await send_queue.put({
                 "uid": uid,
+                "batch": batch,
+                "job": job,
                 "filepath": path,
                 "is_video": bool(msg.video),
                 "is_photo": bool(msg.photo),
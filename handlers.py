@@ -2,6 +2,7 @@ import logging
 import asyncio
 import re
 from telethon import events, Button
+from telethon.errors.rpcerrorlist import FloodWaitError
 from telethon.tl.types import InputMessagesFilterPhotos, InputMessagesFilterVideo
 from telethon.errors import SessionPasswordNeededError
 
@@ -11,11 +12,16 @@ from auth import (
     handle_referral, REFERRAL_BONUS
 )
 from tele_utils import (
-    get_user_client, extract_message_info,
+    get_user_client, extract_message_info, parse_links,
     load_all_dialogs, disconnect_user_client, user_dialogs_cache
 )
 from config import ADMIN_ID, ADMIN_USERNAME
 from state import user_states
+from router import Router
+import broadcast
+import lifecycle
+from username_cache import resolve_username
+from jobs import JobCancelled, new_batch, add_item, release, cancel_user, cancel_all, pending_by_user
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -43,6 +49,8 @@ ADMIN_PANEL = [
     [Button.inline("⚠️ Shutdown Bot",     b"admin:shutdown")]
 ]
 
+DRAINING_MSG = "🔧 Restarting for an update – please try again in a minute."
+
 PREMIUM_PITCH = (
     "🔒 **Batch downloads** are Premium‑only.\n"
     "💎 **Upgrade now:** ₹299 for 10 days of UNLIMITED downloads, batch mode & more!\n"
@@ -72,13 +80,15 @@ def build_keyboard(uid):
         [Button.text("🏠 Home"),   Button.text("❓ Help")],
         [Button.text("🔐 Logout"), Button.text("📥 Send Link")],
         [Button.text("🔢 Batch"),  Button.text("🔄 Refresh")],
+        [Button.text("📑 Bulk")],
     ]
 
 def register_handlers(bot, task_queue, send_queue):
+    router = Router()
 
     # ─── Admin Commands ────────────────────────────────────────────────
 
-    @bot.on(events.NewMessage(pattern=r"^/grant\s+"))
+    @router.command("/grant")
     async def grant_cmd(event):
         if event.sender_id != ADMIN_ID:
             return
@@ -100,12 +110,47 @@ def register_handlers(bot, task_queue, send_queue):
             )
         except: pass
 
-    @bot.on(events.NewMessage(pattern=r"^/admin$"))
+    @router.exact("/admin")
     async def admin_panel(event):
         if event.sender_id != ADMIN_ID:
             return
         await bot.send_message(event.chat_id, "**Admin Panel:**", buttons=ADMIN_PANEL, parse_mode="md")
 
+    @router.command("/broadcast")
+    async def broadcast_cmd(event):
+        if event.sender_id != ADMIN_ID:
+            return
+        if broadcast.current:
+            return await event.reply("⚠️ A broadcast is already running.\n" + broadcast.current.report())
+        parts = event.raw_text.split(None, 1)
+        src   = [event.chat_id, event.reply_to_msg_id] if event.is_reply else None
+        text  = parts[1] if len(parts) == 2 else None
+        if not src and not text:
+            return await event.reply("⚠️ Usage: `/broadcast <message>` or reply to a message with `/broadcast`", parse_mode="md")
+        status = await event.reply(f"📣 Broadcasting to {len(broadcast.known_users)} users…")
+        broadcast.start_broadcast(bot, text=text, src=src, status_msg=[event.chat_id, status.id])
+
+    @router.command("/bcstop")
+    async def broadcast_stop_cmd(event):
+        if event.sender_id != ADMIN_ID:
+            return
+        if not broadcast.current:
+            return await event.reply("ℹ️ No broadcast running.")
+        broadcast.current.stopped = True
+        await event.reply("🛑 Broadcast stopping…")
+
+    @router.command("/cancel")
+    async def cancel_cmd(event):
+        if event.sender_id != ADMIN_ID:
+            return
+        parts = event.raw_text.strip().split()
+        if len(parts) != 2 or not parts[1].isdigit():
+            return await event.reply("⚠️ Usage: `/cancel <user_id>`", parse_mode="md")
+        tgt = int(parts[1])
+        n = cancel_user(tgt)
+        user_states.get(tgt, {}).clear()
+        await event.reply(f"✅ Cancelled {n} items for `{tgt}`.", parse_mode="md")
+
     @bot.on(events.CallbackQuery(data=re.compile(rb"admin:(.+)")))
     async def admin_cb(event):
         if event.sender_id != ADMIN_ID:
@@ -116,11 +161,11 @@ def register_handlers(bot, task_queue, send_queue):
             from auth import authorized
             from datetime import datetime
             active = [u for u,i in authorized.items() if i["expiry"]>datetime.utcnow() and u!=ADMIN_ID]
-            await event.edit(f"📊 Active Premium Users: {len(active)}", buttons=ADMIN_PANEL)
+            await event.edit(f"📊 Active Premium Users: {len(active)}\n👥 Known Users: {len(broadcast.known_users)}", buttons=ADMIN_PANEL)
             return
 
         if action == "broadcast":
-            return await event.answer("✍️ To broadcast, use:\n`/broadcast <message>`", alert=True)
+            return await event.answer("✍️ To broadcast, use:\n`/broadcast <message>` or reply to a message with `/broadcast`\n`/bcstop` to stop", alert=True)
 
         if action == "premiumlist":
             from auth import authorized
@@ -152,14 +197,26 @@ def register_handlers(bot, task_queue, send_queue):
         if action == "viewqueue":
             import download
             dq, uq = download.task_queue.qsize(), download.send_queue.qsize()
-            return await event.edit(f"📋 Download queue: {dq}\nUpload queue: {uq}", buttons=ADMIN_PANEL)
+            per_user = sorted(pending_by_user().items(), key=lambda kv: -kv[1])[:10]
+            lines = [f"👤 `{u}` • {n} pending" for u, n in per_user]
+            kb = [[Button.inline(f"🚫 Cancel {u}", data=f"admin:canceluser:{u}".encode())] for u, _ in per_user]
+            kb.append([Button.inline("🔙 Back", b"admin:stats")])
+            text = f"📋 Download queue: {dq}\nUpload queue: {uq}\n\n" + ("\n".join(lines) or "No active batches")
+            return await event.edit(text, buttons=kb, parse_mode="md")
         if action == "cancelall":
-            import download
-            while not download.task_queue.empty():
-                await download.task_queue.get(); download.task_queue.task_done()
-            while not download.send_queue.empty():
-                await download.send_queue.get(); download.send_queue.task_done()
-            return await event.answer("✅ All tasks cancelled.", alert=True)
+            from jobs import batches
+            uids = list(batches)
+            n = cancel_all()
+            for u in uids:
+                user_states.get(u, {}).clear()
+                try: await bot.send_message(u, "🛑 Your batch was cancelled by the admin.", buttons=build_keyboard(u))
+                except: pass
+            return await event.answer(f"✅ All tasks cancelled ({n} items, {len(uids)} users).", alert=True)
+        if action.startswith("canceluser:"):
+            tgt = int(action.split(":",1)[1])
+            n = cancel_user(tgt)
+            user_states.get(tgt, {}).clear()
+            return await event.answer(f"✅ Cancelled {n} items for {tgt}.", alert=True)
 
         if action == "refreshdialogs":
             user_dialogs_cache.clear()
@@ -169,8 +226,8 @@ def register_handlers(bot, task_queue, send_queue):
             return await event.answer("🗑️ User cache cleared.", alert=True)
 
         if action == "shutdown":
-            await event.answer("⚠️ Shutting down…", alert=True)
-            await bot.disconnect()
+            await event.answer("⚠️ Draining and shutting down…", alert=True)
+            await lifecycle.drain(bot)
             return
 
         await event.answer(f"❓ Unknown action: {action}", alert=True)
@@ -199,18 +256,18 @@ def register_handlers(bot, task_queue, send_queue):
 
     # ─── Text‑button handlers ─────────────────────────────────────────
 
-    @bot.on(events.NewMessage(pattern=r"^🤝 Invite$"))
+    @router.exact("🤝 Invite")
     async def invite_text_cmd(event):
         uid = event.sender_id
         bot_user = await get_bot_username(event.client)
         link = f"https://t.me/{bot_user}?start={uid}"
         await event.reply(f"🤝 **Here is your invite link:**\n{link}\n\nShare it to earn 3 tokens per friend!", parse_mode="md")
 
-    @bot.on(events.NewMessage(pattern=r"^🔄 Refresh$"))
+    @router.exact("🔄 Refresh")
     async def refresh_cmd(event):
         return await start_cmd(event)
 
-    @bot.on(events.NewMessage(pattern=r"^❓ Help$"))
+    @router.exact("❓ Help")
     async def help_cmd(event):
         uid = event.sender_id
         await event.reply(
@@ -220,11 +277,12 @@ def register_handlers(bot, task_queue, send_queue):
             "• 🔑 **Login** / 🔐 **Logout**\n"
             "• 📥 **Send Link** – single download\n"
             "• 🔢 **Batch** – multi download\n"
+            "• 📑 **Bulk** – many links / ranges (`t.me/c/123/100-450`) or a .txt file\n"
             "• 🤝 **Invite** – earn tokens\n",
             buttons=build_keyboard(uid), parse_mode="md"
         )
 
-    @bot.on(events.NewMessage(pattern=r"^🎟️ \d+ tokens$"))
+    @router.command("🎟️")
     async def token_cmd(event):
         uid = event.sender_id
         tokens = get_tokens(uid)
@@ -234,22 +292,24 @@ def register_handlers(bot, task_queue, send_queue):
             buttons=build_keyboard(uid), parse_mode="md"
         )
 
-    @bot.on(events.NewMessage(pattern=r"^Retry$"))
+    @router.exact("Retry")
     async def retry_cmd(event):
         uid  = event.sender_id
         step = user_states.get(uid, {}).get("step")
         if step == "await_single":
             return await event.reply("📨 Paste your link to retry.", buttons=[[Button.text("🏠 Home"), Button.text("Retry")]])
+        if step == "await_bulk":
+            return await event.reply("📨 Paste your links or upload a .txt file.", buttons=[[Button.text("🏠 Home"), Button.text("Retry")]])
         if step == "await_batch_link":
             total = user_states[uid].get("batch_total", 0)
             return await event.reply(f"📨 Paste first link to queue {total}.", buttons=[[Button.text("🏠 Home"), Button.text("Retry")]])
         return await start_cmd(event)
 
-    @bot.on(events.NewMessage(pattern=r"^🏠 Home$"))
+    @router.control("🏠 Home")
     async def home_cmd(event):
         return await start_cmd(event)
 
-    @bot.on(events.NewMessage(pattern=r"^🔑 Login$"))
+    @router.exact("🔑 Login")
     async def login_cmd(event):
         uid = event.sender_id
         client = await get_user_client(uid)
@@ -264,16 +324,18 @@ def register_handlers(bot, task_queue, send_queue):
             parse_mode="md"
         )
 
-    @bot.on(events.NewMessage(pattern=r"^🔐 Logout$"))
+    @router.exact("🔐 Logout")
     async def logout_cmd(event):
         uid = event.sender_id
         await disconnect_user_client(uid)
         user_states.pop(uid, None)
         await event.reply("✅ Logged out. See you soon!", buttons=build_keyboard(uid))
 
-    @bot.on(events.NewMessage(pattern=r"^🔢 Batch$"))
+    @router.exact("🔢 Batch")
     async def batch_cmd(event):
         uid    = event.sender_id
+        if lifecycle.draining:
+            return await event.reply(DRAINING_MSG)
         st     = user_states.setdefault(uid, {})
         client = await get_user_client(uid)
         if not await client.is_user_authorized():
@@ -288,11 +350,11 @@ def register_handlers(bot, task_queue, send_queue):
         st["step"] = "await_batch_size"
         await event.reply("🔢 **Batch Mode:** Choose how many items to download (10–{})".format(lim), buttons=kb, parse_mode="md")
 
-    @bot.on(events.NewMessage(pattern=r"^[0-9]+$"))
+    @router.step("await_batch_size")
     async def batch_size_cmd(event):
         uid = event.sender_id
         st  = user_states.get(uid, {})
-        if st.get("step") != "await_batch_size":
+        if st.get("step") != "await_batch_size" or not event.raw_text.strip().isdigit():
             return
         n, lim = int(event.raw_text), get_batch_limit(uid)
         if n not in range(10, lim+1, 10):
@@ -300,39 +362,193 @@ def register_handlers(bot, task_queue, send_queue):
         st.update(batch_total=n, waiting_batch=n, step="await_batch_link")
         await event.reply(f"📨 Paste first link to queue **{n}** items.", buttons=[[Button.text("🏠 Home"), Button.text("Retry")]])
 
-    @bot.on(events.NewMessage(pattern=r"^❌ Stop$"))
+    @router.control("❌ Stop")
     async def stop_batch(event):
         uid = event.sender_id
         st  = user_states.get(uid, {})
-        if st.get("step") not in ("await_batch_link","batch_sending"):
+        n   = cancel_user(uid)
+        if not n and st.get("step") not in ("await_batch_link","batch_sending","await_bulk"):
             return await event.reply("ℹ️ No batch in progress.", buttons=build_keyboard(uid))
         st.clear()
-        await event.reply("🛑 Batch cancelled.", buttons=build_keyboard(uid))
+        await event.reply(f"🛑 Batch cancelled ({n} items dropped).", buttons=build_keyboard(uid))
 
-    @bot.on(events.NewMessage())
+    @router.step("await_batch_link", "batch_sending")
     async def batch_flow(event):
         text, uid = event.raw_text.strip(), event.sender_id
         st = user_states.get(uid, {})
         if st.get("step") not in ("await_batch_link","batch_sending"):
             return
+        if lifecycle.draining:
+            return await event.reply(DRAINING_MSG)
         cid, mid, priv = extract_message_info(text)
         if cid is None:
             return await event.reply("⚠️ Invalid link. Retry.", buttons=[[Button.text("Retry")]])
-        if priv and uid not in user_dialogs_cache:
-            await load_all_dialogs(await get_user_client(uid), uid)
-        ent = user_dialogs_cache.get(uid, {}).get(cid) if priv else cid
-        if not ent:
-            return await event.reply("⚠️ Chat not found. Retry.", buttons=[[Button.text("Retry")]])
-
-        total, fetched = st["batch_total"], 0
-        orig = await event.client.get_messages(ent, ids=[mid])
-        if orig and getattr(orig[0], "media", None):
-            await task_queue.put((uid, cid, mid, priv)); fetched = 1
-        if fetched < total:
-            photos = await event.client.get_messages(ent, limit=total-fetched, filter=InputMessagesFilterPhotos(), offset_id=mid, reverse=True)
-            videos = await event.client.get_messages(ent, limit=total-fetched, filter=InputMessagesFilterVideo(), offset_id=mid, reverse=True)
-            for m in sorted(photos+videos, key=lambda m: m.id):
-                if fetched>=total: break
-                await task_queue.put((uid, cid, m.id, priv)); fetched+=1
+
+        # register the batch before any slow call so ❌ Stop can always find it
+        total, fetched = st.get("batch_total", 0), 0
+        batch = new_batch(uid)
+        try:
+            if priv and uid not in user_dialogs_cache:
+                await batch.run(load_all_dialogs(await get_user_client(uid), uid))
+            if priv:
+                ent = user_dialogs_cache.get(uid, {}).get(cid)
+            else:
+                # the bot account resolves with its own access hashes (cache owner 0)
+                try: ent = await batch.run(resolve_username(event.client, 0, cid))
+                except JobCancelled: raise
+                except FloodWaitError as e:
+                    return await event.reply(f"⏳ Too many lookups – try again in {e.seconds}s.", buttons=[[Button.text("Retry")]])
+                except Exception: ent = None
+            if not ent:
+                return await event.reply("⚠️ Chat not found. Retry.", buttons=[[Button.text("Retry")]])
+
+            orig = await batch.run(event.client.get_messages(ent, ids=[mid]))
+            if orig and getattr(orig[0], "media", None):
+                add_item(batch); await task_queue.put((uid, cid, mid, priv, batch)); fetched = 1
+            if fetched < total:
+                photos = await batch.run(event.client.get_messages(ent, limit=total-fetched, filter=InputMessagesFilterPhotos(), offset_id=mid, reverse=True))
+                videos = await batch.run(event.client.get_messages(ent, limit=total-fetched, filter=InputMessagesFilterVideo(), offset_id=mid, reverse=True))
+                for m in sorted(photos+videos, key=lambda m: m.id):
+                    if fetched>=total or batch.cancelled: break
+                    add_item(batch); await task_queue.put((uid, cid, m.id, priv, batch)); fetched+=1
+        except JobCancelled:
+            return   # ❌ Stop already replied
+        finally:
+            release(batch)   # nothing queued → don't leave an empty batch behind
+        if batch.cancelled:
+            return
         st["step"]="batch_sending"
         await event.reply(f"🚀 Queued {fetched}/{total}! ❌ Stop to cancel.", buttons=[[Button.text("🏠 Home"), Button.text("Retry")]])
+
+    # ─── Bulk link ingestion ───────────────────────────────────────────
+
+    BULK_FILE_MAX = 1024 * 1024   # .txt uploads larger than this are refused
+
+    @router.exact("📑 Bulk")
+    @router.command("/bulk")
+    async def bulk_cmd(event):
+        uid    = event.sender_id
+        if lifecycle.draining:
+            return await event.reply(DRAINING_MSG)
+        st     = user_states.setdefault(uid, {})
+        client = await get_user_client(uid)
+        if not await client.is_user_authorized():
+            return await event.reply("🔐 Please log in first.", buttons=build_keyboard(uid))
+        if not is_authorized(uid):
+            return await event.reply(PREMIUM_PITCH, buttons=[[Button.inline("💎 Buy Premium", b"buy")]], parse_mode="md")
+
+        # links pasted right after /bulk are ingested straight away
+        if event.raw_text.startswith("/bulk") and parse_links(event.raw_text, 1)[0]:
+            return await bulk_flow(event)
+
+        st["step"] = "await_bulk"
+        await event.reply(
+            f"📑 **Bulk Mode:** paste links (one message, any number) or upload a .txt file.\n"
+            f"Ranges work too: `t.me/c/123/100-450`. Limit: **{get_batch_limit(uid)}** items.",
+            buttons=[[Button.text("🏠 Home"), Button.text("Retry")]], parse_mode="md"
+        )
+
+    @router.step("await_bulk")
+    async def bulk_flow(event):
+        uid  = event.sender_id
+        if lifecycle.draining:
+            return await event.reply(DRAINING_MSG)
+        st   = user_states.setdefault(uid, {})
+        text = event.raw_text or ""
+        if event.file and (event.file.mime_type == "text/plain" or (event.file.name or "").endswith(".txt")):
+            if (event.file.size or 0) > BULK_FILE_MAX:
+                return await event.reply("⚠️ File too large (max 1 MB).", buttons=[[Button.text("Retry")]])
+            data = await event.download_media(bytes)
+            text = data.decode("utf-8", "ignore")
+
+        limit = get_batch_limit(uid)
+        groups, truncated = parse_links(text, limit)
+        if not groups:
+            return await event.reply("⚠️ No valid links found. Retry.", buttons=[[Button.text("Retry")]])
+
+        client  = await get_user_client(uid)
+        queued  = 0
+        skipped = []
+        batch   = new_batch(uid)
+        # start fresh counters only if nothing from an earlier bulk is still
+        # uploading; the extra 1 keeps the uploader from announcing completion
+        # while chunks are still being fetched and is released at the end.
+        # The step stays "await_bulk" so the next message is another bulk list.
+        if st.get("waiting_batch", 0) <= 0:
+            st.update(batch_total=0, waiting_batch=0)
+        st["waiting_batch"] += 1
+        st["step"] = "await_bulk"
+        try:
+            for chat, (priv, ids) in groups.items():
+                if priv and uid not in user_dialogs_cache:
+                    await load_all_dialogs(client, uid)
+                if priv:
+                    ent = user_dialogs_cache.get(uid, {}).get(chat)
+                else:
+                    try: ent = await batch.run(resolve_username(client, uid, chat))
+                    except JobCancelled: raise
+                    except FloodWaitError as e:
+                        skipped.append(f"{chat} (retry in {e.seconds}s)")
+                        continue
+                    except Exception: ent = None
+                if not ent:
+                    skipped.append(str(chat))
+                    continue
+                # one request per 100 ids; media messages are queued as each chunk arrives
+                before = queued
+                try:
+                    for i in range(0, len(ids), 100):
+                        chunk = ids[i:i+100]
+                        while True:
+                            try:
+                                msgs = await batch.run(client.get_messages(ent, ids=chunk))
+                                break
+                            except FloodWaitError as e:
+                                logger.warning(f"⚠️ FloodWait {e.seconds}s during bulk fetch")
+                                await batch.run(asyncio.sleep(e.seconds + 1))
+                        for m in msgs:
+                            if m and m.media:
+                                st["batch_total"]   = st.get("batch_total", 0) + 1
+                                st["waiting_batch"] = st.get("waiting_batch", 0) + 1
+                                add_item(batch)
+                                await task_queue.put((uid, chat, m.id, priv, batch))
+                                queued += 1
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    logger.warning(f"⚠️ Bulk fetch failed for {chat}: {e}")
+                    skipped.append(f"{chat} (partial)" if queued > before else str(chat))
+        except JobCancelled:
+            return   # ❌ Stop already replied
+        finally:
+            release(batch)
+            if not batch.cancelled and "waiting_batch" in st:
+                st["waiting_batch"] -= 1
+
+        if not queued:
+            return await event.reply("⚠️ No media found in those links.", buttons=[[Button.text("🏠 Home"), Button.text("Retry")]])
+        if st.get("waiting_batch") == 0:
+            # every upload finished before the last chunk was fetched
+            total = st.get("batch_total", queued)
+            await event.respond(f"✅ All {total}/{total} files uploaded!")
+
+        note = ""
+        if truncated:
+            note += f"\n✂️ Trimmed to your limit of {limit} items."
+        if skipped:
+            note += f"\n⚠️ Skipped chats: {', '.join(skipped)}"
+        await event.reply(
+            f"🚀 Queued {queued} items from {len(groups)} chat(s)! ❌ Stop to cancel.{note}",
+            buttons=[[Button.text("🏠 Home"), Button.text("Retry")]]
+        )
+
+    # ─── Single entry point for all text messages ─────────────────────
+
+    @bot.on(events.NewMessage())
+    async def dispatch(event):
+        if event.is_private:
+            broadcast.register_user(event.sender_id)
+        broadcast.note_interactive()
+        await router.dispatch(event)
+
+    return router
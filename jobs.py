@@ -0,0 +1,95 @@
+# jobs.py — Job registry with per-batch cancellation tokens
+#
+# Every batch a user queues gets a Batch token that travels with each of its
+# items through task_queue and send_queue. Workers check it before starting
+# a stage, and in-flight downloads/uploads run as tasks the token can cancel.
+
+import asyncio
+import itertools
+
+# In‑memory index
+batches   = {}                  # uid -> {batch_id: Batch}
+in_flight = set()               # (uid, cid, mid, priv) taken by a worker, not yet finished
+_next_id  = itertools.count(1)
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when the item's batch was cancelled."""
+
+
+class Batch:
+    def __init__(self, uid: int, batch_id: int):
+        self.uid       = uid
+        self.id        = batch_id
+        self.cancelled = False
+        self.pending   = 0          # items still somewhere in the pipeline
+        self._tasks    = set()      # in‑flight download/upload tasks
+
+    async def run(self, coro):
+        """Await `coro` as a task that cancel() can abort mid‑transfer."""
+        if self.cancelled:
+            coro.close()
+            raise JobCancelled()
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if self.cancelled:
+                raise JobCancelled() from None
+            raise
+        finally:
+            self._tasks.discard(task)
+
+    def cancel(self):
+        self.cancelled = True
+        for task in list(self._tasks):
+            task.cancel()
+        batches.get(self.uid, {}).pop(self.id, None)
+        if not batches.get(self.uid, True):
+            batches.pop(self.uid, None)
+
+
+def new_batch(uid: int) -> Batch:
+    batch = Batch(uid, next(_next_id))
+    batches.setdefault(uid, {})[batch.id] = batch
+    return batch
+
+def add_item(batch: Batch):
+    """Count one more queued item against `batch`."""
+    batch.pending += 1
+    if not batch.cancelled:
+        batches.setdefault(batch.uid, {})[batch.id] = batch
+
+def release(batch: Batch):
+    """Drop `batch` from the index if nothing was ever queued on it."""
+    if batch.pending <= 0:
+        user = batches.get(batch.uid, {})
+        user.pop(batch.id, None)
+        if not user:
+            batches.pop(batch.uid, None)
+
+def item_started(job: tuple):
+    """A worker picked up `job`; it stays in flight until item_done()."""
+    in_flight.add(job)
+
+def item_done(batch: Batch, job: tuple = None):
+    """An item left the pipeline (uploaded, skipped or failed)."""
+    in_flight.discard(job)
+    batch.pending -= 1
+    release(batch)
+
+def cancel_user(uid: int) -> int:
+    """Cancel every batch of `uid`; return how many queued items were dropped."""
+    dropped = 0
+    for batch in list(batches.get(uid, {}).values()):
+        dropped += batch.pending
+        batch.cancel()
+    return dropped
+
+def cancel_all() -> int:
+    return sum(cancel_user(uid) for uid in list(batches))
+
+def pending_by_user() -> dict:
+    """uid -> number of items still queued or in flight."""
+    return {uid: sum(b.pending for b in bs.values()) for uid, bs in batches.items()}
@@ -0,0 +1,129 @@
+# lifecycle.py — Graceful drain on shutdown and job recovery on startup
+
+import os
+import json
+import time
+import asyncio
+import logging
+import download
+import broadcast
+from jobs import in_flight, new_batch, add_item, cancel_all
+from tele_utils import disconnect_all_clients
+from session_store import get_store
+from username_cache import warm
+from config import DOWNLOAD_DIR, SESSIONS_DIR, DRAIN_TIMEOUT
+from state import user_states
+
+logger = logging.getLogger(__name__)
+
+# Jobs that were still queued or in flight when the last drain ended
+PENDING_FILE = os.path.join(SESSIONS_DIR, "pending_jobs.json")
+
+draining = False   # set once shutdown starts; handlers refuse new jobs
+_warm_tasks = set()
+
+# ─── SHUTDOWN ────────────────────────────────────────────────────────
+
+def _take_queued():
+    """Pull every not‑yet‑started job out of task_queue and the deferred set."""
+    jobs = []
+    while not download.task_queue.empty():
+        uid, cid, mid, priv, batch = download.task_queue.get_nowait()
+        if not batch.cancelled:
+            jobs.append((uid, cid, mid, priv))
+        download.task_queue.task_done()
+    # jobs waiting out a FloodWait aren't on the queue yet
+    for handle, (uid, cid, mid, priv, batch) in list(download.deferred.items()):
+        handle.cancel()
+        del download.deferred[handle]
+        if not batch.cancelled:
+            jobs.append((uid, cid, mid, priv))
+    return jobs
+
+async def drain(bot, timeout: float = DRAIN_TIMEOUT):
+    """
+    Stop taking work, give in‑flight transfers up to `timeout` seconds,
+    checkpoint everything left over and disconnect all clients.
+    """
+    global draining
+    if draining:
+        return
+    draining = True
+    logger.info(f"🚧 Draining (up to {timeout}s)…")
+
+    leftover = _take_queued()
+    if broadcast.current:
+        await broadcast.current.pause()
+
+    deadline = time.monotonic() + timeout
+    while in_flight and time.monotonic() < deadline:
+        await asyncio.sleep(0.5)
+
+    # whatever didn't make it gets checkpointed, then aborted; take the
+    # queue again for handlers that passed the draining check before we began
+    leftover += _take_queued()
+    leftover += list(in_flight)
+    cancel_all()
+    _save_pending(leftover)
+    logger.info(f"💾 Checkpointed {len(leftover)} unfinished jobs")
+
+    await disconnect_all_clients()
+    await bot.disconnect()
+    await get_store().aflush()
+
+def _save_pending(jobs):
+    try:
+        os.makedirs(os.path.dirname(PENDING_FILE), exist_ok=True)
+        with open(PENDING_FILE, 'w') as f:
+            json.dump([list(j) for j in dict.fromkeys(jobs)], f)
+    except Exception as e:
+        logger.error(f"⚠️ Could not save {PENDING_FILE}: {e}")
+
+# ─── STARTUP ─────────────────────────────────────────────────────────
+
+def clear_orphans():
+    """Remove half‑written downloads and thumbnails left by the last run."""
+    removed = 0
+    for name in os.listdir(DOWNLOAD_DIR):
+        path = os.path.join(DOWNLOAD_DIR, name)
+        if os.path.isfile(path):
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+    if removed:
+        logger.info(f"🧹 Removed {removed} orphaned files from {DOWNLOAD_DIR}")
+
+async def restore_pending():
+    """Requeue jobs checkpointed by the last drain, one batch per user."""
+    try:
+        with open(PENDING_FILE, 'r') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return
+    except Exception as e:
+        logger.error(f"⚠️ Could not load {PENDING_FILE}: {e}")
+        return
+
+    per_user = {}
+    for uid, cid, mid, priv in data:
+        per_user.setdefault(uid, []).append((uid, cid, mid, priv))
+
+    for uid, jobs in per_user.items():
+        # resolve public usernames before the workers need them
+        usernames = [cid for _, cid, _, priv in jobs if not priv]
+        if usernames:
+            task = asyncio.create_task(warm(uid, usernames))
+            _warm_tasks.add(task)
+            task.add_done_callback(_warm_tasks.discard)
+
+        st = user_states.setdefault(uid, {})
+        st.update(batch_total=len(jobs), waiting_batch=len(jobs), step="batch_sending")
+        batch = new_batch(uid)
+        for job in jobs:
+            add_item(batch)
+            await download.task_queue.put((*job, batch))
+    # only now is it safe to drop the checkpoint
+    os.remove(PENDING_FILE)
+    logger.info(f"♻️ Requeued {len(data)} jobs for {len(per_user)} users")
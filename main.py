@@ -1,4 +1,5 @@
 import os
+import signal
 import asyncio
 import logging
 try:
@@ -18,6 +19,10 @@ from auth import cleanup_authorized
 from download import download_worker
 from uploader import upload_worker
 from handlers import register_handlers
+from broadcast import flush_users_loop, resume_broadcast
+from lifecycle import drain, clear_orphans, restore_pending
+from session_store import SharedSession, migrate_file_sessions, flush_sessions_loop
+from username_cache import flush_usernames_loop
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
 logger = logging.getLogger(__name__)
@@ -25,14 +30,19 @@ logger = logging.getLogger(__name__)
 async def main():
     os.makedirs(DOWNLOAD_DIR, exist_ok=True)
     os.makedirs(SESSIONS_DIR, exist_ok=True)
+    clear_orphans()
+    await asyncio.to_thread(migrate_file_sessions)
 
-    bot = TelegramClient("bot_session", API_ID, API_HASH)
+    bot = TelegramClient(await SharedSession.open("bot_session"), API_ID, API_HASH)
     await bot.start(bot_token=BOT_TOKEN)
     logger.info("✅ Bot connected successfully")
 
     # start cleanup loop
     asyncio.create_task(cleanup_authorized())
     logger.info(f"🛡️  Started auth cleanup loop (every {SUB_CLEANUP_INTERVAL}s)")
+    asyncio.create_task(flush_users_loop())
+    asyncio.create_task(flush_sessions_loop())
+    asyncio.create_task(flush_usernames_loop())
 
     # initialize queues
     import download
@@ -56,6 +66,20 @@ async def main():
         asyncio.create_task(upload_worker(bot, download.send_queue))
     logger.info(f"🚀 Launched {ul_workers} upload workers")
 
+    # pick up work interrupted by the last restart
+    await restore_pending()
+    resume_broadcast(bot)
+
+    # systemd stops us with SIGTERM: drain instead of dying mid‑transfer
+    loop = asyncio.get_running_loop()
+    drain_tasks = set()   # keep a reference so the drain isn't garbage‑collected
+    def on_signal():
+        task = asyncio.create_task(drain(bot))
+        drain_tasks.add(task)
+        task.add_done_callback(drain_tasks.discard)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, on_signal)
+
     try:
         await bot.run_until_disconnected()
     except (KeyboardInterrupt, asyncio.CancelledError):
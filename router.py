@@ -0,0 +1,130 @@
+# router.py — Table-driven dispatch for incoming messages
+#
+# One NewMessage handler is registered with Telethon; every update is routed
+# through dict lookups (exact button text → command word → user step) instead
+# of having Telethon test 20+ regexes and run every matching coroutine.
+
+import asyncio
+import logging
+from config import USER_INBOX_LIMIT
+from state import user_states
+
+logger = logging.getLogger(__name__)
+
+
+class Router:
+    """
+    Route a message to at most one handler:
+      1. exact text       (reply‑keyboard buttons, bare commands)
+      2. command word     (first token, e.g. "/grant" or "🎟️")
+      3. user step        (user_states[uid]["step"])
+    Handlers for the same user run one at a time from a bounded inbox, so a
+    burst from one user can't starve everybody else. Control routes (Stop,
+    Home) skip the inbox so they never wait behind a long ingestion.
+    """
+
+    def __init__(self, inbox_limit: int = USER_INBOX_LIMIT):
+        self.control_routes = {}   # text  -> handler, run outside the inbox
+        self.exact_routes   = {}   # text  -> handler
+        self.command_routes = {}   # word  -> handler
+        self.step_routes    = {}   # step  -> handler
+        self.inbox_limit    = inbox_limit
+        self._inboxes       = {}   # uid -> asyncio.Queue[event]
+        self._pumps         = {}   # uid -> asyncio.Task draining that inbox
+        self._control_tasks = set()
+
+    # ─── Registration ────────────────────────────────────────────────
+
+    def control(self, *texts):
+        def deco(fn):
+            for t in texts:
+                self.control_routes[t] = fn
+            return fn
+        return deco
+
+    def exact(self, *texts):
+        def deco(fn):
+            for t in texts:
+                self.exact_routes[t] = fn
+            return fn
+        return deco
+
+    def command(self, *words):
+        def deco(fn):
+            for w in words:
+                self.command_routes[w] = fn
+            return fn
+        return deco
+
+    def step(self, *steps):
+        def deco(fn):
+            for s in steps:
+                self.step_routes[s] = fn
+            return fn
+        return deco
+
+    # ─── Dispatch ────────────────────────────────────────────────────
+
+    def resolve(self, uid: int, text: str):
+        """Return the handler for `text` from `uid`, or None."""
+        handler = self.exact_routes.get(text)
+        if handler:
+            return handler
+        if text:
+            word = text.split(None, 1)[0]
+            if word.startswith("/"):
+                word = word.split("@", 1)[0]     # /cmd@BotName → /cmd
+            handler = self.command_routes.get(word)
+            if handler:
+                return handler
+        step = user_states.get(uid, {}).get("step")
+        return self.step_routes.get(step) if step else None
+
+    async def dispatch(self, event):
+        uid  = event.sender_id
+        text = (event.raw_text or "").strip()
+
+        control = self.control_routes.get(text)
+        if control:
+            task = asyncio.create_task(self._run(uid, control, event))
+            self._control_tasks.add(task)
+            task.add_done_callback(self._control_tasks.discard)
+            return
+
+        # only a filter here: the handler is resolved again when it runs,
+        # after earlier messages may have moved the user to another step
+        if self.resolve(uid, text) is None:
+            return
+
+        inbox = self._inboxes.get(uid)
+        if inbox is None:
+            inbox = self._inboxes[uid] = asyncio.Queue(maxsize=self.inbox_limit)
+        try:
+            inbox.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning(f"⚠️ Inbox full for uid={uid}, dropping message")
+            try: await event.reply("⏳ Too many messages at once – wait for the previous ones to finish, or tap ❌ Stop.")
+            except: pass
+            return
+
+        if uid not in self._pumps:
+            self._pumps[uid] = asyncio.create_task(self._pump(uid, inbox))
+
+    async def _pump(self, uid: int, inbox: asyncio.Queue):
+        try:
+            while not inbox.empty():
+                event   = inbox.get_nowait()
+                handler = self.resolve(uid, (event.raw_text or "").strip())
+                if handler:
+                    await self._run(uid, handler, event)
+        finally:
+            # no await between the empty() check and here, so nothing can
+            # slip into the inbox unnoticed
+            self._pumps.pop(uid, None)
+            self._inboxes.pop(uid, None)
+
+    async def _run(self, uid: int, handler, event):
+        try:
+            await handler(event)
+        except Exception as e:
+            logger.error(f"[HANDLER ERROR] uid={uid} {handler.__name__}: {e}", exc_info=True)
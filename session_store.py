@@ -0,0 +1,299 @@
+# session_store.py — All Telethon sessions in one shared SQLite database
+#
+# Replaces one `.session` file per user with a single WAL‑mode database.
+# All SQLite work runs in worker threads over a small connection pool, so
+# reconnect storms load sessions in parallel without blocking the event loop.
+# Writes (auth keys, DC info, entity cache, update state) are coalesced in
+# memory and committed in one transaction per flush.
+
+import os
+import glob
+import queue
+import sqlite3
+import asyncio
+import datetime
+import logging
+from contextlib import contextmanager
+from telethon.crypto import AuthKey
+from telethon.sessions import MemorySession
+from telethon.tl.types.updates import State
+from config import SESSIONS_DIR, SESSION_DB_POOL, SESSION_FLUSH_EVERY
+
+logger = logging.getLogger(__name__)
+
+# Path of the shared database
+SESSION_DB = os.path.join(SESSIONS_DIR, "sessions.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    name TEXT PRIMARY KEY, dc_id INTEGER, server_address TEXT,
+    port INTEGER, auth_key BLOB, takeout_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS entities (
+    session TEXT, id INTEGER, hash INTEGER NOT NULL, username TEXT,
+    phone INTEGER, name TEXT, date INTEGER, PRIMARY KEY (session, id)
+);
+CREATE INDEX IF NOT EXISTS entities_username ON entities (session, username);
+CREATE INDEX IF NOT EXISTS entities_phone    ON entities (session, phone);
+CREATE TABLE IF NOT EXISTS update_state (
+    session TEXT, id INTEGER, pts INTEGER, qts INTEGER, date INTEGER,
+    seq INTEGER, PRIMARY KEY (session, id)
+);
+"""
+
+
+class SessionStore:
+    def __init__(self, path: str = SESSION_DB, pool_size: int = SESSION_DB_POOL):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path     = path
+        self._pool    = queue.Queue()
+        self._pending = {}     # (table, key) -> (sql, params); last write wins
+        self._flush_lock = asyncio.Lock()
+        self._bg      = set()  # flush/delete tasks scheduled from sync callers
+        for _ in range(max(pool_size, 1)):
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._pool.put(conn)
+        with self._conn() as c:
+            c.executescript(_SCHEMA)
+
+    @contextmanager
+    def _conn(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def query(self, sql: str, params=()):
+        with self._conn() as c:
+            return c.execute(sql, params).fetchall()
+
+    def write(self, key: tuple, sql: str, params):
+        """Queue a write; repeated writes to the same key are coalesced."""
+        self._pending[key] = (sql, params)
+
+    def _commit(self, ops):
+        with self._conn() as c:
+            with c:
+                for sql, params in ops.values():
+                    c.execute(sql, params)
+
+    def flush(self):
+        """Blocking flush; only for startup/shutdown outside the event loop."""
+        ops, self._pending = self._pending, {}
+        try:
+            if ops:
+                self._commit(ops)
+        except Exception:
+            self._requeue(ops)
+            raise
+
+    async def aflush(self):
+        """Commit queued writes in a worker thread, one flush at a time."""
+        async with self._flush_lock:
+            ops, self._pending = self._pending, {}
+            if not ops:
+                return
+            try:
+                await asyncio.to_thread(self._commit, ops)
+            except Exception:
+                self._requeue(ops)
+                raise
+
+    def _requeue(self, ops):
+        # put failed writes back without clobbering newer ones queued meanwhile
+        for key, op in ops.items():
+            self._pending.setdefault(key, op)
+
+    def schedule(self, coro):
+        """Run `coro` in the background (for Telethon's synchronous hooks)."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)   # no loop (scripts, tests): just run it
+        task = loop.create_task(coro)
+        self._bg.add(task)
+        task.add_done_callback(self._bg.discard)
+
+    def load_session(self, name: str):
+        """Return (session_row, update_state_rows, entity_rows) for `name`."""
+        with self._conn() as c:
+            sess = c.execute(
+                "SELECT dc_id, server_address, port, auth_key, takeout_id FROM sessions WHERE name = ?",
+                (name,)
+            ).fetchone()
+            states = c.execute(
+                "SELECT id, pts, qts, date, seq FROM update_state WHERE session = ?", (name,)
+            ).fetchall()
+            ents = c.execute(
+                "SELECT id, hash, username, phone, name FROM entities WHERE session = ?", (name,)
+            ).fetchall()
+        return sess, states, ents
+
+    def delete_session(self, name: str):
+        with self._conn() as c:
+            with c:
+                for table, col in (("sessions", "name"), ("entities", "session"), ("update_state", "session")):
+                    c.execute(f"DELETE FROM {table} WHERE {col} = ?", (name,))
+
+    def has_session(self, name: str) -> bool:
+        return bool(self.query("SELECT 1 FROM sessions WHERE name = ?", (name,)))
+
+    def close(self):
+        self.flush()
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+_store = None
+
+def get_store() -> SessionStore:
+    global _store
+    if _store is None:
+        _store = SessionStore()
+    return _store
+
+async def flush_sessions_loop():
+    """Commit queued session writes every SESSION_FLUSH_EVERY seconds."""
+    while True:
+        await asyncio.sleep(SESSION_FLUSH_EVERY)
+        try:
+            await get_store().aflush()
+        except Exception as e:
+            logger.error(f"⚠️ Session flush failed: {e}")
+
+
+class SharedSession(MemorySession):
+    """A Telethon session stored under `name` in the shared SessionStore."""
+
+    def __init__(self, name: str, store: SessionStore, sess=None, states=(), ents=()):
+        super().__init__()
+        self.name  = name
+        self.store = store
+        if sess:
+            self._dc_id, self._server_address, self._port, key, self._takeout_id = sess
+            self._auth_key = AuthKey(data=key) if key else None
+        for eid, pts, qts, date, seq in states:
+            date = datetime.datetime.fromtimestamp(date, tz=datetime.timezone.utc)
+            self._update_states[eid] = State(pts, qts, date, seq, unread_count=0)
+        # the whole entity cache lives in memory, so Telethon's synchronous
+        # lookups never touch the database
+        self._entities = set(ents)
+
+    @classmethod
+    async def open(cls, name: str, store: SessionStore = None):
+        """Load session `name` in a worker thread and return it."""
+        store = store or get_store()
+        await store.aflush()   # make sure we read our own queued writes
+        sess, states, ents = await asyncio.to_thread(store.load_session, name)
+        return cls(name, store, sess, states, ents)
+
+    # ─── Auth key & DC ───────────────────────────────────────────────
+
+    def _update_session(self):
+        self.store.write(
+            ("sessions", self.name),
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?)",
+            (self.name, self._dc_id, self._server_address, self._port,
+             self._auth_key.key if self._auth_key else b"", self._takeout_id)
+        )
+
+    def set_dc(self, dc_id, server_address, port):
+        super().set_dc(dc_id, server_address, port)
+        self._update_session()
+
+    @MemorySession.auth_key.setter
+    def auth_key(self, value):
+        self._auth_key = value
+        self._update_session()
+
+    @MemorySession.takeout_id.setter
+    def takeout_id(self, value):
+        self._takeout_id = value
+        self._update_session()
+
+    def set_update_state(self, entity_id, state):
+        super().set_update_state(entity_id, state)
+        self.store.write(
+            ("update_state", self.name, entity_id),
+            "INSERT OR REPLACE INTO update_state VALUES (?, ?, ?, ?, ?, ?)",
+            (self.name, entity_id, state.pts, state.qts, int(state.date.timestamp()), state.seq)
+        )
+
+    def save(self):
+        self.store.schedule(self.store.aflush())
+
+    def close(self):
+        self.store.schedule(self.store.aflush())
+
+    def delete(self):
+        store, name = self.store, self.name
+        store._pending = {k: v for k, v in store._pending.items() if k[1] != name}
+        store.schedule(asyncio.to_thread(store.delete_session, name))
+
+    # ─── Entity cache ────────────────────────────────────────────────
+
+    def process_entities(self, tlo):
+        rows = self._entities_to_rows(tlo)
+        if not rows:
+            return
+        self._entities |= set(rows)
+        now = int(datetime.datetime.now().timestamp())
+        for eid, ehash, username, phone, name in rows:
+            self.store.write(
+                ("entities", self.name, eid),
+                "INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.name, eid, ehash, username, phone, name, now)
+            )
+
+
+# ─── ONE‑TIME MIGRATION ──────────────────────────────────────────────
+
+def migrate_file_sessions(paths=None):
+    """
+    Copy every legacy `<name>.session` SQLite file into the shared store
+    and rename it to `<name>.session.migrated`.
+    """
+    store = get_store()
+    if paths is None:
+        paths = glob.glob(os.path.join(SESSIONS_DIR, "*.session")) + glob.glob("*.session")
+
+    migrated = 0
+    for path in paths:
+        name = os.path.basename(path)[:-len(".session")]
+        try:
+            if not store.has_session(name):
+                src = sqlite3.connect(path)
+                try:
+                    sess = src.execute(
+                        "SELECT dc_id, server_address, port, auth_key, takeout_id FROM sessions"
+                    ).fetchone()
+                    ents = src.execute(
+                        "SELECT id, hash, username, phone, name, date FROM entities"
+                    ).fetchall()
+                    try:
+                        states = src.execute(
+                            "SELECT id, pts, qts, date, seq FROM update_state"
+                        ).fetchall()
+                    except sqlite3.OperationalError:
+                        states = []   # very old session layout
+                finally:
+                    src.close()
+                if not sess:
+                    continue
+                with store._conn() as c:
+                    with c:
+                        c.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?)", (name, *sess))
+                        c.executemany("INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                      [(name, *e) for e in ents])
+                        c.executemany("INSERT OR REPLACE INTO update_state VALUES (?, ?, ?, ?, ?, ?)",
+                                      [(name, *s) for s in states])
+                migrated += 1
+            os.replace(path, path + ".migrated")
+        except Exception as e:
+            logger.error(f"⚠️ Could not migrate {path}: {e}")
+
+    if migrated:
+        logger.info(f"📦 Migrated {migrated} session files into {store.path}")
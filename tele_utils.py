@@ -1,12 +1,12 @@
 # tele_utils.py — Patched to handle FloodWait and add throttling
 
-import os
 import re
 import asyncio
 from telethon import TelegramClient
 from telethon.tl.functions.messages import GetDialogsRequest
 from telethon.tl.types import InputPeerEmpty
-from config import API_ID, API_HASH, SESSIONS_DIR
+from config import API_ID, API_HASH
+from session_store import SharedSession
 try:
     from telethon.errors import FloodWait
 except ImportError:
@@ -16,6 +16,13 @@ except ImportError:
 user_clients = {}       # uid -> TelegramClient instance
 user_dialogs_cache = {} # uid -> {chat_id: entity}
 
+# Link patterns (compiled once, used for every message)
+_PRIVATE_LINK_RE = re.compile(r"(?:https?://)?t\.me/c/(\d+)/(\d+)")
+_PUBLIC_LINK_RE  = re.compile(r"(?:https?://)?t\.me/([^/]+)/(\d+)")
+_ANY_LINK_RE     = re.compile(
+    r"(?:https?://)?t\.me/(?:c/(\d+)|([A-Za-z0-9_]+))/(\d+)(?:-(\d+))?"
+)
+
 async def get_user_client(uid: int) -> TelegramClient:
     """Return or create a Telethon client for user `uid`."""
     if uid in user_clients:
@@ -24,8 +31,8 @@ async def get_user_client(uid: int) -> TelegramClient:
             await client.connect()
         return client
 
-    session_file = os.path.join(SESSIONS_DIR, f"user_{uid}")
-    client = TelegramClient(session_file, API_ID, API_HASH)
+    session = await SharedSession.open(f"user_{uid}")
+    client = TelegramClient(session, API_ID, API_HASH)
     await client.connect()
     user_clients[uid] = client
     return client
@@ -42,6 +49,13 @@ async def disconnect_user_client(uid: int):
             pass
     user_dialogs_cache.pop(uid, None)
 
+async def disconnect_all_clients():
+    """Disconnect every pooled user client concurrently."""
+    clients = list(user_clients.values())
+    user_clients.clear()
+    user_dialogs_cache.clear()
+    await asyncio.gather(*(c.disconnect() for c in clients), return_exceptions=True)
+
 async def load_all_dialogs(client: TelegramClient, uid: int):
     """Load and cache all of `uid`'s dialogs, with flood-wait handling and throttling."""
     try:
@@ -93,10 +107,40 @@ def extract_message_info(link: str):
     Returns (None, None, None) if invalid.
     """
     link = link.strip()
-    m = re.match(r"(?:https?://)?t\.me/c/(\d+)/(\d+)", link)
+    m = _PRIVATE_LINK_RE.match(link)
     if m:
         return -100 * int(m.group(1)), int(m.group(2)), True
-    m = re.match(r"(?:https?://)?t\.me/([^/]+)/(\d+)", link)
+    m = _PUBLIC_LINK_RE.match(link)
     if m:
         return m.group(1), int(m.group(2)), False
     return None, None, None
+
+def parse_links(text: str, limit: int):
+    """
+    Parse every t.me link in `text`, including `…/100-450` id ranges.
+    Returns ({chat: (is_private, [message_ids])}, truncated): chats keep
+    first‑seen order, ids are deduplicated and sorted, and at most `limit`
+    ids are returned in total.
+    """
+    groups, total, truncated = {}, 0, False
+    for m in _ANY_LINK_RE.finditer(text):
+        priv  = m.group(1) is not None
+        chat  = -100 * int(m.group(1)) if priv else m.group(2)
+        first = int(m.group(3))
+        last  = int(m.group(4)) if m.group(4) else first
+        if first > last:
+            first, last = last, first
+
+        ids = groups.setdefault(chat, (priv, set()))[1]
+        for mid in range(first, last + 1):
+            if mid in ids:
+                continue
+            if total >= limit:
+                truncated = True
+                break
+            ids.add(mid)
+            total += 1
+        if truncated:
+            break
+
+    return {chat: (priv, sorted(ids)) for chat, (priv, ids) in groups.items() if ids}, truncated
@@ -3,15 +3,34 @@ from telethon.errors.rpcerrorlist import FloodWaitError
 from telethon.tl.types import DocumentAttributeVideo
 from config import UPLOAD_DELAY
 from state import user_states
+from jobs import JobCancelled, item_done
+from broadcast import note_interactive
 
 logger = logging.getLogger(__name__)
 user_locks = {}
 user_progress_msgs = {}
 
+async def _drop_progress(bot, uid):
+    last = user_progress_msgs.pop(uid, None)
+    if last:
+        try: await bot.delete_messages(uid, last)
+        except: pass
+
+async def _discard(bot, uid, batch, job, filepath):
+    """Drop a cancelled item: free its disk space and progress message."""
+    for path in (filepath, filepath + ".thumb.jpg"):
+        if os.path.exists(path):
+            try: os.remove(path)
+            except: pass
+    item_done(batch, job)
+    await _drop_progress(bot, uid)
+
 async def upload_worker(bot, send_queue):
     while True:
         info     = await send_queue.get()
         uid      = info["uid"]
+        batch    = info["batch"]
+        job      = info.get("job")
         filepath = info.get("filepath")
         is_video = info.get("is_video")
         is_photo = info.get("is_photo")
@@ -20,8 +39,18 @@ async def upload_worker(bot, send_queue):
         h        = info.get("height")
         cap      = info.get("caption")
 
+        if batch.cancelled:
+            await _discard(bot, uid, batch, job, filepath)
+            send_queue.task_done()
+            continue
+
         lock = user_locks.setdefault(uid, asyncio.Lock())
         async with lock:
+            if batch.cancelled:
+                await _discard(bot, uid, batch, job, filepath)
+                send_queue.task_done()
+                continue
+
             st      = user_states.setdefault(uid, {})
             total   = st.get("batch_total", 0)
             waiting = st.get("waiting_batch", 0)
@@ -69,15 +98,18 @@ async def upload_worker(bot, send_queue):
                 # send with flood-wait handling
                 while True:
                     try:
-                        await bot.send_file(entity=uid, **kwargs)
+                        note_interactive()
+                        await batch.run(bot.send_file(entity=uid, **kwargs))
                         break
                     except FloodWaitError as e:
                         logger.warning(f"⚠️ FloodWait {e.seconds}s")
-                        await asyncio.sleep(e.seconds + 1)
+                        await batch.run(asyncio.sleep(e.seconds + 1))
 
                 if UPLOAD_DELAY:
                     await asyncio.sleep(UPLOAD_DELAY)
 
+            except JobCancelled:
+                logger.info(f"🛑 Upload cancelled uid={uid}")
             except Exception as e:
                 logger.error(f"[UPLOAD ERROR] {e}", exc_info=True)
             finally:
@@ -90,13 +122,16 @@ async def upload_worker(bot, send_queue):
                     try: os.remove(thumb)
                     except: pass
 
-                if waiting is not None:
-                    st["waiting_batch"] = waiting - 1
-                    if st["waiting_batch"] <= 0:
-                        last = user_progress_msgs.pop(uid, None)
-                        if last:
-                            try: await bot.delete_messages(uid, last)
-                            except: pass
+                item_done(batch, job)
+                if batch.cancelled:
+                    await _drop_progress(bot, uid)
+                else:
+                    # decrement the live value: bulk ingestion may have added
+                    # items while this upload was running
+                    st["waiting_batch"] = st.get("waiting_batch", 0) - 1
+                    if st["waiting_batch"] == 0:
+                        total = st.get("batch_total", total)
+                        await _drop_progress(bot, uid)
                         try:
                             await bot.send_message(uid, f"✅ All {total}/{total} files uploaded!")
                         except: pass
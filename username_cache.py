@@ -0,0 +1,151 @@
+# username_cache.py — Shared, persistent cache for public username resolution
+#
+# ResolveUsername is one of the most flood‑limited RPCs, so every public link
+# goes through here instead of letting Telethon resolve the username again for
+# each job. Entries are per user client because access hashes are per account.
+
+import os
+import json
+import time
+import asyncio
+import logging
+from telethon.tl.functions.contacts import ResolveUsernameRequest
+from telethon.tl.types import PeerChannel, InputPeerChannel
+from telethon.errors.rpcerrorlist import UsernameNotOccupiedError, UsernameInvalidError, FloodWaitError
+from tele_utils import get_user_client
+from config import SESSIONS_DIR, USERNAME_TTL, USERNAME_MISS_TTL, USERS_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Path of the persisted cache
+USERNAME_FILE = os.path.join(SESSIONS_DIR, "usernames.json")
+
+# In‑memory state
+_cache    = {}      # (uid, username) -> (channel_id | None, access_hash | None, expires_at)
+_inflight = {}      # (uid, username) -> Future shared by concurrent lookups
+_flooded  = {}      # uid -> time until which that account must not call ResolveUsername
+_dirty    = False
+
+
+class UsernameNotFound(ValueError):
+    """The username doesn't exist or isn't a channel/supergroup."""
+
+
+def _load():
+    try:
+        with open(USERNAME_FILE, 'r') as f:
+            data = json.load(f)
+        now = time.time()
+        for key, (cid, ahash, expires) in data.items():
+            if expires > now:
+                uid, username = key.split(":", 1)
+                _cache[(int(uid), username)] = (cid, ahash, expires)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"⚠️ Could not load {USERNAME_FILE}: {e}")
+
+def _save():
+    global _dirty
+    try:
+        now = time.time()
+        tmp = {
+            f"{uid}:{username}": list(entry)
+            for (uid, username), entry in _cache.items()
+            if entry[2] > now
+        }
+        os.makedirs(os.path.dirname(USERNAME_FILE), exist_ok=True)
+        with open(USERNAME_FILE + ".tmp", 'w') as f:
+            json.dump(tmp, f)
+        os.replace(USERNAME_FILE + ".tmp", USERNAME_FILE)
+        _dirty = False
+    except Exception as e:
+        logger.error(f"⚠️ Could not save {USERNAME_FILE}: {e}")
+
+# Load on import
+_load()
+
+async def flush_usernames_loop():
+    """Persist new resolutions in batches and drop expired entries."""
+    while True:
+        await asyncio.sleep(USERS_FLUSH_INTERVAL)
+        now = time.time()
+        for key, entry in list(_cache.items()):
+            if entry[2] <= now:
+                del _cache[key]
+        if _dirty:
+            _save()
+
+def _store(key, cid, ahash, ttl):
+    global _dirty
+    _cache[key] = (cid, ahash, time.time() + ttl)
+    _dirty = True
+
+async def _resolve(client, key, username):
+    try:
+        result = await client(ResolveUsernameRequest(username))
+    except (UsernameNotOccupiedError, UsernameInvalidError):
+        _store(key, None, None, USERNAME_MISS_TTL)
+        raise UsernameNotFound(username)
+    except FloodWaitError as e:
+        # the flood limit is per account: lookups on it fail fast until then
+        logger.warning(f"⚠️ FloodWait {e.seconds}s resolving @{username} (uid={key[0]})")
+        _flooded[key[0]] = time.time() + e.seconds + 1
+        raise
+
+    if isinstance(result.peer, PeerChannel):
+        for chat in result.chats:
+            if chat.id == result.peer.channel_id:
+                _store(key, chat.id, chat.access_hash, USERNAME_TTL)
+                return chat.id, chat.access_hash
+    _store(key, None, None, USERNAME_MISS_TTL)
+    raise UsernameNotFound(username)
+
+async def resolve_username(client, uid: int, username: str) -> InputPeerChannel:
+    """
+    Return an InputPeerChannel for public `username` as seen by `client`
+    (owned by `uid`). Raises UsernameNotFound, including from the negative
+    cache. Concurrent calls for the same key share a single request. While
+    the account is flood‑limited, cache misses raise FloodWaitError carrying
+    the remaining wait right away, so callers can defer instead of blocking.
+    """
+    key = (uid, username.lower())
+    hit = _cache.get(key)
+    if hit and hit[2] > time.time():
+        if hit[0] is None:
+            raise UsernameNotFound(username)
+        return InputPeerChannel(hit[0], hit[1])
+
+    wait = _flooded.get(uid, 0) - time.time()
+    if wait > 0:
+        raise FloodWaitError(ResolveUsernameRequest(username), capture=int(wait) + 1)
+    _flooded.pop(uid, None)
+
+    fut = _inflight.get(key)
+    if fut is None:
+        fut = _inflight[key] = asyncio.ensure_future(_resolve(client, key, username))
+        fut.add_done_callback(lambda f: (_inflight.pop(key, None), f.cancelled() or f.exception()))
+    # shield so one cancelled waiter doesn't cancel the lookup for the others
+    cid, ahash = await asyncio.shield(fut)
+    return InputPeerChannel(cid, ahash)
+
+async def warm(uid: int, usernames):
+    """Resolve `usernames` ahead of the jobs that need them, gently."""
+    try:
+        client = await get_user_client(uid)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not warm usernames for uid={uid}: {e}")
+        return
+    for username in dict.fromkeys(usernames):
+        hit = _cache.get((uid, username.lower()))
+        if hit and hit[2] > time.time():
+            continue
+        try:
+            await resolve_username(client, uid, username)
+        except FloodWaitError as e:
+            # the workers will defer their own jobs; no point warming the rest
+            logger.warning(f"⚠️ Stopped warming for uid={uid}: flood‑limited for {e.seconds}s")
+            return
+        except Exception as e:
+            logger.warning(f"⚠️ Could not warm @{username} for uid={uid}: {e}")
+        await asyncio.sleep(1)